@@ -0,0 +1,221 @@
+import concurrent.futures
+import random
+import threading
+import time
+
+# Timeout types raised by the Pinecone client's HTTP layer
+TIMEOUT_ERRORS = (TimeoutError, concurrent.futures.TimeoutError)
+try:
+    from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
+    TIMEOUT_ERRORS += (Urllib3TimeoutError,)
+except ImportError:
+    pass
+
+# Only used for errors without an HTTP status
+THROTTLE_PHRASES = ("too many requests", "rate limit exceeded")
+
+def _error_status(error):
+    """HTTP status of an upsert error, or None if it has none"""
+    status = getattr(error, "status", None)
+    return status if isinstance(status, int) else None
+
+def _is_timeout(error):
+    """Check an error, and the errors it wraps, for a client timeout"""
+    while error is not None:
+        if isinstance(error, TIMEOUT_ERRORS):
+            return True
+        # urllib3 reports the underlying timeout as MaxRetryError.reason
+        reason = getattr(error, "reason", None)
+        error = reason if isinstance(reason, BaseException) else error.__cause__
+    return False
+
+def is_throttle_error(error):
+    """Check whether an upsert error is a rate limit / throttling response"""
+    status = _error_status(error)
+    if status is not None:
+        return status == 429
+    message = str(error).lower()
+    return any(phrase in message for phrase in THROTTLE_PHRASES)
+
+def is_retryable_error(error):
+    """Check whether an upsert error is transient: throttling, a 5xx response or a timeout"""
+    status = _error_status(error)
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    return is_throttle_error(error) or _is_timeout(error)
+
+class AdaptiveController:
+    """
+    AIMD controller for the number of in-flight upserts and the batch size
+
+    Every `workers` fast upserts (at or under target_latency) add one worker
+    and batch_step chunks to the batch size. A slow upsert shrinks the batch
+    size, and a throttle or error response shrinks both by decrease_factor.
+    Decreases are limited to one per cooldown period, so a burst of failures
+    from the same overload only backs off once.
+    """
+
+    def __init__(self, workers=1, batch_size=20, min_workers=1, max_workers=16,
+                 min_batch_size=5, max_batch_size=200, target_latency=1.0,
+                 batch_step=5, decrease_factor=0.5, cooldown=None, log=print):
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers, min_workers)
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max(max_batch_size, min_batch_size)
+        self.workers = min(max(workers, self.min_workers), self.max_workers)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.target_latency = target_latency
+        self.batch_step = batch_step
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown if cooldown is not None else target_latency
+        self.log = log
+
+        self.successes = 0
+        self.throttles = 0
+        self.errors = 0
+        self._fast_streak = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _set(self, workers, batch_size, reason):
+        """Apply new values, logging them if they changed"""
+        if (workers, batch_size) != (self.workers, self.batch_size):
+            self.log(f"Adaptive: workers {self.workers} -> {workers}, "
+                     f"batch size {self.batch_size} -> {batch_size} ({reason})")
+            self.workers = workers
+            self.batch_size = batch_size
+
+    def _can_decrease(self):
+        now = time.time()
+        if now - self._last_decrease < self.cooldown:
+            return False
+        self._last_decrease = now
+        return True
+
+    def record_success(self, latency):
+        """Record a successful upsert and its latency in seconds"""
+        with self._lock:
+            self.successes += 1
+
+            if latency > self.target_latency:
+                # Additive increase stops; shrink the payload of each request
+                self._fast_streak = 0
+                if self._can_decrease():
+                    batch_size = max(self.min_batch_size, int(self.batch_size * self.decrease_factor))
+                    self._set(self.workers, batch_size, f"slow upsert {latency:.2f}s")
+                return
+
+            self._fast_streak += 1
+            if self._fast_streak >= self.workers:
+                self._fast_streak = 0
+                workers = min(self.max_workers, self.workers + 1)
+                batch_size = min(self.max_batch_size, self.batch_size + self.batch_step)
+                self._set(workers, batch_size, "increase")
+
+    def record_failure(self, throttled=False):
+        """Record a throttled or failed upsert"""
+        with self._lock:
+            if throttled:
+                self.throttles += 1
+            else:
+                self.errors += 1
+
+            self._fast_streak = 0
+            if self._can_decrease():
+                workers = max(self.min_workers, int(self.workers * self.decrease_factor))
+                batch_size = max(self.min_batch_size, int(self.batch_size * self.decrease_factor))
+                self._set(workers, batch_size, "throttled" if throttled else "error")
+
+    def summary(self):
+        """Describe the values the controller converged to"""
+        return (f"Adaptive controller converged to {self.workers} workers and batch size "
+                f"{self.batch_size} ({self.successes} upserts, {self.throttles} throttled, "
+                f"{self.errors} errors)")
+
+class ControlledIndex:
+    """
+    Wraps an index so throttled upserts are retried instead of dropped
+
+    Throttles, 5xx responses and timeouts are retried with exponential
+    backoff, and the last error is raised once retries run out. Any other
+    error (auth, bad payload, dimension mismatch) is raised immediately.
+    If a controller is given, every upsert is timed and reported to it.
+    """
+
+    def __init__(self, index, controller=None, max_retries=5, backoff=0.5):
+        self.index = index
+        self.controller = controller
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def upsert(self, vectors, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            start_time = time.time()
+            try:
+                result = self.index.upsert(vectors=vectors, **kwargs)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    raise
+                if self.controller:
+                    self.controller.record_failure(throttled=is_throttle_error(e))
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+                continue
+
+            if self.controller:
+                self.controller.record_success(time.time() - start_time)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+class SimulatedThrottleError(Exception):
+    """Throttling response raised by SimulatedIndex"""
+    status = 429
+
+class SimulatedIndex:
+    """
+    Local stand-in for a Pinecone index that injects latency and throttling
+
+    Each upsert takes base_latency plus per_vector_latency per vector, and
+    slows down as more requests are in flight. Requests beyond capacity, and
+    a random throttle_rate fraction of all requests, fail with a 429 error.
+    """
+
+    def __init__(self, base_latency=0.05, per_vector_latency=0.002, capacity=4,
+                 throttle_rate=0.0, seed=0):
+        self.base_latency = base_latency
+        self.per_vector_latency = per_vector_latency
+        self.capacity = capacity
+        self.throttle_rate = throttle_rate
+        self.vector_ids = set()
+        self._in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, **kwargs):
+        with self._lock:
+            self._in_flight += 1
+            in_flight = self._in_flight
+            throttled = in_flight > self.capacity or self._random.random() < self.throttle_rate
+
+        try:
+            if throttled:
+                time.sleep(self.base_latency / 2)
+                raise SimulatedThrottleError("Too Many Requests: simulated throttling")
+
+            # Latency grows with payload size and with concurrent load
+            contention = 1 + in_flight / self.capacity
+            time.sleep((self.base_latency + self.per_vector_latency * len(vectors)) * contention)
+
+            with self._lock:
+                self.vector_ids.update(vector[0] for vector in vectors)
+            return {"upserted_count": len(vectors)}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def describe_index_stats(self):
+        with self._lock:
+            return {"total_vector_count": len(self.vector_ids)}
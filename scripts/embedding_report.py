@@ -0,0 +1,156 @@
+from sentence_transformers import SentenceTransformer
+import sys
+import time
+import argparse
+import random
+import numpy as np
+from embedding_utils import (
+    MODEL_NAME, PROJECTION_METHODS, VECTOR_DTYPES,
+    fit_projection, apply_projection, quantize_vectors, search_vectors
+)
+
+def search_excluding_self(query_vectors, vectors, scales, top_k, self_indices):
+    """Search, dropping each query's own chunk from its results"""
+    if self_indices is None:
+        return search_vectors(query_vectors, vectors, scales, top_k=top_k)[1]
+
+    _, indices = search_vectors(query_vectors, vectors, scales, top_k=top_k + 1)
+    results = []
+    for row, self_idx in zip(indices, self_indices):
+        results.append([i for i in row if i != self_idx][:top_k])
+    return np.array(results)
+
+def recall_at_k(results, ground_truth):
+    """Fraction of the exact top-k neighbours found by an approximate search"""
+    hits = sum(len(set(r) & set(g)) for r, g in zip(results, ground_truth))
+    return hits / ground_truth.size
+
+def run_report(data_chunks, queries=None, dims=None, method="pca", dtypes=VECTOR_DTYPES,
+               top_k=10, num_queries=100):
+    """
+    Compare recall@k, storage and search latency across embedding settings
+
+    Ground truth is an exact float32 search over the full-dimension embeddings.
+    Without explicit queries, a sample of chunks is used as queries (each
+    chunk's own vector is excluded from its results).
+
+    Args:
+        data_chunks: List of text chunks forming the corpus
+        queries: Optional list of query strings
+        dims: Target dimensions to evaluate (default: full, 384, 256, 128)
+        method: Projection method ("pca" or "truncate")
+        dtypes: Storage dtypes to evaluate
+        top_k: Number of neighbours used for recall@k
+        num_queries: Number of chunks sampled as queries when queries is None
+    """
+    model = SentenceTransformer(MODEL_NAME)
+
+    print(f"Encoding {len(data_chunks)} chunks...")
+    corpus = model.encode(data_chunks)
+    source_dim = corpus.shape[1]
+
+    if queries:
+        query_embeddings = model.encode(queries)
+        self_indices = None
+    else:
+        self_indices = random.Random(0).sample(range(len(data_chunks)), min(num_queries, len(data_chunks)))
+        query_embeddings = corpus[self_indices]
+
+    full_corpus = apply_projection(corpus, None)
+    full_queries = apply_projection(query_embeddings, None)
+    ground_truth = search_excluding_self(full_queries, full_corpus, None, top_k, self_indices)
+
+    dims = dims or [source_dim, 384, 256, 128]
+
+    print(f"\nrecall@{top_k} over {len(full_queries)} queries, {len(data_chunks)} vectors ({method} projection)")
+    print("=" * 80)
+    print(f"{'dim':>6} {'dtype':>8} {'recall':>8} {'bytes/vec':>10} {'storage MB':>11} {'ms/query':>9}")
+    print("-" * 80)
+
+    for dim in dims:
+        if dim > source_dim:
+            print(f"Skipping dimension {dim}: larger than the embedding dimension {source_dim}")
+            continue
+
+        projection = None
+        if dim < source_dim:
+            try:
+                projection = fit_projection(corpus, dim, method=method)
+            except ValueError as e:
+                print(f"Skipping dimension {dim}: {e}")
+                continue
+
+        projected_corpus = apply_projection(corpus, projection)
+        projected_queries = apply_projection(query_embeddings, projection)
+
+        for dtype in dtypes:
+            vectors, scales = quantize_vectors(projected_corpus, dtype)
+
+            start_time = time.time()
+            results = search_excluding_self(projected_queries, vectors, scales, top_k, self_indices)
+            elapsed_ms = (time.time() - start_time) * 1000 / len(projected_queries)
+
+            bytes_per_vector = dim * vectors.dtype.itemsize + (4 if scales is not None else 0)
+            storage_mb = bytes_per_vector * len(vectors) / (1024 * 1024)
+            recall = recall_at_k(results, ground_truth)
+
+            print(f"{dim:>6} {dtype:>8} {recall:>8.4f} {bytes_per_vector:>10} {storage_mb:>11.2f} {elapsed_ms:>9.3f}")
+
+    print("=" * 80)
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Report recall@k versus storage and latency for embedding settings')
+    parser.add_argument('--chunks', default='temp_chunks.txt',
+                        help='File with one chunk per line (default: temp_chunks.txt)')
+    parser.add_argument('--queries', default=None,
+                        help='File with one query per line (default: sample chunks as queries)')
+    parser.add_argument('--dims', default=None,
+                        help='Comma-separated target dimensions (default: full,384,256,128)')
+    parser.add_argument('--method', choices=PROJECTION_METHODS, default='pca',
+                        help='Projection method (default: pca)')
+    parser.add_argument('--dtypes', default=','.join(VECTOR_DTYPES),
+                        help=f'Comma-separated storage dtypes (default: {",".join(VECTOR_DTYPES)})')
+    parser.add_argument('--top-k', type=int, default=10,
+                        help='k for recall@k (default: 10)')
+    parser.add_argument('--num-queries', type=int, default=100,
+                        help='Number of chunks sampled as queries (default: 100)')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Limit the number of chunks to use (default: use all)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    args = parse_arguments()
+
+    # Load data chunks
+    with open(args.chunks, "r", encoding='utf-8') as f:
+        data_chunks = [line.strip() for line in f if line.strip()]
+
+    if args.limit and args.limit > 0:
+        data_chunks = data_chunks[:args.limit]
+
+    queries = None
+    if args.queries:
+        with open(args.queries, "r", encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    dtypes = [d.strip() for d in args.dtypes.split(',') if d.strip()]
+    for dtype in dtypes:
+        if dtype not in VECTOR_DTYPES:
+            print(f"Error: Unknown dtype '{dtype}'. Choose from {', '.join(VECTOR_DTYPES)}")
+            sys.exit(1)
+
+    if len(data_chunks) <= args.top_k:
+        print(f"Error: Need more than {args.top_k} chunks to compute recall@{args.top_k}")
+        sys.exit(1)
+
+    run_report(
+        data_chunks,
+        queries=queries,
+        dims=[int(d) for d in args.dims.split(',')] if args.dims else None,
+        method=args.method,
+        dtypes=dtypes,
+        top_k=args.top_k,
+        num_queries=args.num_queries
+    )
@@ -0,0 +1,363 @@
+import os
+import time
+import numpy as np
+import torch
+import sentence_transformers
+from sentence_transformers import SentenceTransformer
+
+# Embedding model shared by ingestion and querying
+# MODEL_NAME = 'all-MiniLM-L6-v2'  # 384 dimensions
+MODEL_NAME = 'all-mpnet-base-v2'  # 768 dimensions
+
+# Encoder modes: full-precision model, or dynamically int8-quantized for CPU
+ENCODER_MODES = ["fp32", "int8"]
+DEFAULT_MODEL_CACHE_DIR = ".model_cache"
+
+DEFAULT_PROJECTION_PATH = "projection.npz"
+
+PROJECTION_METHODS = ["pca", "truncate"]
+VECTOR_DTYPES = ["float32", "float16", "int8"]
+
+# Rows scored at a time when searching a local index
+SEARCH_BLOCK_SIZE = 65536
+
+# Encoders already loaded in this process, keyed by (model, mode)
+_encoders = {}
+
+def _quantized_model_path(model_name, cache_dir):
+    """Cache path for quantized weights, tied to the library versions that saved them"""
+    safe_name = model_name.replace('/', '_')
+    versions = f"torch{torch.__version__}-st{sentence_transformers.__version__}"
+    return os.path.join(cache_dir, f"{safe_name}-int8-{versions}.state.pt")
+
+def _swap_in_quantized_linears(module):
+    """
+    Replace nn.Linear layers with empty dynamic int8 Linear layers
+
+    Gives the same module structure as quantize_dynamic without quantizing
+    any weights, ready for load_state_dict.
+    """
+    for name, child in module.named_children():
+        if type(child) is torch.nn.Linear:
+            setattr(module, name, torch.ao.nn.quantized.dynamic.Linear(
+                child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8
+            ))
+        else:
+            _swap_in_quantized_linears(child)
+    return module
+
+def _load_quantized_encoder(model_name, cache_path):
+    """Build the int8 model from config alone and load cached weights into it"""
+    # An empty state_dict makes transformers build the model from its config
+    # without reading the fp32 weights
+    model = SentenceTransformer(model_name, device="cpu", model_kwargs={"state_dict": {}})
+    model = _swap_in_quantized_linears(model)
+    model.load_state_dict(torch.load(cache_path, weights_only=True))
+    return model
+
+def load_encoder(mode="fp32", threads=None, model_name=MODEL_NAME,
+                 cache_dir=DEFAULT_MODEL_CACHE_DIR, warmup=True):
+    """
+    Load the embedding model
+
+    In "int8" mode the Linear layers are dynamically quantized to int8 for
+    faster CPU inference. The first run loads the fp32 model, quantizes it and
+    saves the int8 weights (state_dict only) to cache_dir. Later runs build
+    the model from its config and load the cached weights with
+    weights_only=True, skipping the fp32 weights and the conversion.
+
+    Args:
+        mode: "fp32" or "int8"
+        threads: Number of intra-op threads for torch (default: torch's choice)
+        model_name: SentenceTransformer model to load
+        cache_dir: Directory for the quantized model cache
+        warmup: Run one encode call so the first real query is not slowed down
+
+    Returns:
+        SentenceTransformer model
+    """
+    if mode not in ENCODER_MODES:
+        raise ValueError(f"Unknown encoder mode: {mode}")
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    key = (model_name, mode)
+    if key in _encoders:
+        return _encoders[key]
+
+    if mode == "fp32":
+        model = SentenceTransformer(model_name)
+    else:
+        cache_path = _quantized_model_path(model_name, cache_dir)
+        model = None
+        if os.path.exists(cache_path):
+            try:
+                model = _load_quantized_encoder(model_name, cache_path)
+            except Exception as e:
+                print(f"Could not load quantized weights from {cache_path}: {e}")
+                model = None
+
+        if model is None:
+            model = SentenceTransformer(model_name, device="cpu")
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            print(f"Quantized {model_name} to int8")
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write atomically so an interrupted run never leaves a partial file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            torch.save(model.state_dict(), tmp_path)
+            os.replace(tmp_path, cache_path)
+            print(f"Saved quantized weights to {cache_path}")
+        model.eval()
+
+    if warmup:
+        model.encode(["warmup"])
+
+    _encoders[key] = model
+    return model
+
+def check_encoder_parity(texts, threads=None, model_name=MODEL_NAME, cache_dir=DEFAULT_MODEL_CACHE_DIR):
+    """
+    Compare int8 embeddings against the fp32 model
+
+    Returns:
+        Dictionary with cosine drift (1 - cosine similarity) statistics and
+        encode times for both modes
+    """
+    fp32_model = load_encoder("fp32", threads=threads, model_name=model_name)
+    int8_model = load_encoder("int8", threads=threads, model_name=model_name, cache_dir=cache_dir)
+
+    start_time = time.time()
+    fp32_embeddings = normalize(np.asarray(fp32_model.encode(texts), dtype=np.float32))
+    fp32_seconds = time.time() - start_time
+
+    start_time = time.time()
+    int8_embeddings = normalize(np.asarray(int8_model.encode(texts), dtype=np.float32))
+    int8_seconds = time.time() - start_time
+
+    drift = 1.0 - (fp32_embeddings * int8_embeddings).sum(axis=1)
+    return {
+        "count": len(texts),
+        "mean_drift": float(drift.mean()),
+        "max_drift": float(drift.max()),
+        "p95_drift": float(np.percentile(drift, 95)),
+        "fp32_seconds": fp32_seconds,
+        "int8_seconds": int8_seconds,
+    }
+
+def normalize(vectors):
+    """L2-normalize vectors row by row"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def fit_projection(embeddings, target_dim, method="pca"):
+    """
+    Fit a projection that reduces embeddings to target_dim dimensions
+
+    Args:
+        embeddings: Array of corpus embeddings (n x dim)
+        target_dim: Number of output dimensions
+        method: "pca" (principal components of the corpus) or
+                "truncate" (keep the leading dimensions, Matryoshka-style)
+
+    Returns:
+        Projection dictionary, usable with apply_projection and save_projection
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    source_dim = embeddings.shape[1]
+
+    if method not in PROJECTION_METHODS:
+        raise ValueError(f"Unknown projection method: {method}")
+    if target_dim > source_dim:
+        raise ValueError(f"Target dimension {target_dim} is larger than the embedding dimension {source_dim}")
+
+    if method == "pca":
+        if len(embeddings) < target_dim:
+            raise ValueError(f"PCA to {target_dim} dimensions needs at least {target_dim} samples, got {len(embeddings)}")
+        mean = embeddings.mean(axis=0)
+        _, _, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        components = vt[:target_dim]
+    else:
+        mean = np.zeros(source_dim, dtype=np.float32)
+        components = np.zeros((0, source_dim), dtype=np.float32)
+
+    return {
+        "method": method,
+        "target_dim": target_dim,
+        "mean": mean.astype(np.float32),
+        "components": components.astype(np.float32),
+    }
+
+def apply_projection(embeddings, projection):
+    """Project embeddings and re-normalize them for cosine similarity"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+
+    if projection is None:
+        projected = embeddings
+    elif projection["method"] == "pca":
+        projected = (embeddings - projection["mean"]) @ projection["components"].T
+    else:
+        projected = embeddings[:, :projection["target_dim"]]
+
+    return normalize(projected)
+
+def save_projection(projection, path=DEFAULT_PROJECTION_PATH):
+    """Save a projection to an .npz file"""
+    np.savez(
+        path,
+        method=np.array(projection["method"]),
+        target_dim=np.array(projection["target_dim"]),
+        mean=projection["mean"],
+        components=projection["components"],
+    )
+
+def load_projection(path=DEFAULT_PROJECTION_PATH):
+    """Load a projection saved with save_projection"""
+    with np.load(path) as data:
+        return {
+            "method": str(data["method"]),
+            "target_dim": int(data["target_dim"]),
+            "mean": data["mean"],
+            "components": data["components"],
+        }
+
+def quantize_vectors(vectors, dtype="float32"):
+    """
+    Convert vectors to a storage dtype
+
+    int8 vectors are scaled per row to the [-127, 127] range; the scales are
+    returned alongside so scores can be restored.
+
+    Returns:
+        Tuple of (stored vectors, per-row scales or None)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+def search_vectors(query_vectors, vectors, scales=None, top_k=5):
+    """
+    Brute-force cosine search over (possibly quantized) normalized vectors
+
+    Args:
+        query_vectors: Array of normalized query vectors (q x dim)
+        vectors: Stored vectors, as returned by quantize_vectors
+        scales: Per-row int8 scales, as returned by quantize_vectors
+        top_k: Number of results per query
+
+    Returns:
+        Tuple of (scores, indices), each of shape (q x top_k)
+    """
+    query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+    top_k = min(top_k, len(vectors))
+
+    # Score in blocks so int8/float16 data is never fully expanded to float32
+    scores = np.empty((len(query_vectors), len(vectors)), dtype=np.float32)
+    for start in range(0, len(vectors), SEARCH_BLOCK_SIZE):
+        block = vectors[start:start + SEARCH_BLOCK_SIZE].astype(np.float32)
+        block_scores = query_vectors @ block.T
+        if scales is not None:
+            block_scores *= scales[start:start + SEARCH_BLOCK_SIZE]
+        scores[:, start:start + SEARCH_BLOCK_SIZE] = block_scores
+
+    indices = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+def _pack_strings(strings):
+    """
+    Pack strings into one UTF-8 byte array plus offsets
+
+    Unlike np.array(strings), which pads every row to the longest string in
+    UTF-32, this stores each string at its encoded length.
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _unpack_string(data, offsets, i):
+    """Decode the i-th string packed by _pack_strings"""
+    return data[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+def save_local_index(path, ids, texts, vectors, dtype="float32", projection=None):
+    """
+    Save vectors and their texts to a local .npz index
+
+    The projection used to produce the vectors (if any) is stored with them,
+    so queries against the index are reduced the same way automatically.
+    """
+    stored, scales = quantize_vectors(vectors, dtype)
+    projection_arrays = {}
+    if projection is not None:
+        projection_arrays = {
+            "projection_method": np.array(projection["method"]),
+            "projection_target_dim": np.array(projection["target_dim"]),
+            "projection_mean": projection["mean"],
+            "projection_components": projection["components"],
+        }
+    id_bytes, id_offsets = _pack_strings(ids)
+    text_bytes, text_offsets = _pack_strings(texts)
+    np.savez(
+        path,
+        id_bytes=id_bytes,
+        id_offsets=id_offsets,
+        text_bytes=text_bytes,
+        text_offsets=text_offsets,
+        vectors=stored,
+        scales=scales if scales is not None else np.zeros(0, dtype=np.float32),
+        **projection_arrays
+    )
+
+def load_local_index(path):
+    """Load a local index saved with save_local_index"""
+    with np.load(path) as data:
+        scales = data["scales"]
+        projection = None
+        if "projection_method" in data.files:
+            projection = {
+                "method": str(data["projection_method"]),
+                "target_dim": int(data["projection_target_dim"]),
+                "mean": data["projection_mean"],
+                "components": data["projection_components"],
+            }
+        return {
+            "id_bytes": data["id_bytes"],
+            "id_offsets": data["id_offsets"],
+            "text_bytes": data["text_bytes"],
+            "text_offsets": data["text_offsets"],
+            "vectors": data["vectors"],
+            "scales": scales if len(scales) else None,
+            "projection": projection,
+        }
+
+def query_local_index(local_index, query_vector, top_k=5):
+    """
+    Query a local index
+
+    Returns:
+        Results in the same shape as a Pinecone query response
+    """
+    scores, indices = search_vectors(
+        query_vector, local_index["vectors"], local_index["scales"], top_k=top_k
+    )
+    matches = []
+    for score, i in zip(scores[0], indices[0]):
+        matches.append({
+            "id": _unpack_string(local_index["id_bytes"], local_index["id_offsets"], i),
+            "score": float(score),
+            "metadata": {"text": _unpack_string(local_index["text_bytes"], local_index["text_offsets"], i)},
+        })
+    return {"matches": matches}
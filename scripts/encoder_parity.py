@@ -0,0 +1,42 @@
+import sys
+import argparse
+from embedding_utils import DEFAULT_MODEL_CACHE_DIR, check_encoder_parity
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Compare int8 encoder embeddings against the fp32 model')
+    parser.add_argument('--chunks', default='temp_chunks.txt',
+                        help='File with one chunk per line (default: temp_chunks.txt)')
+    parser.add_argument('--limit', type=int, default=200,
+                        help='Number of chunks to compare (default: 200)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Number of intra-op threads for the encoder (default: torch default)')
+    parser.add_argument('--cache-dir', default=DEFAULT_MODEL_CACHE_DIR,
+                        help=f'Directory for the quantized model cache (default: {DEFAULT_MODEL_CACHE_DIR})')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    args = parse_arguments()
+
+    # Load data chunks
+    with open(args.chunks, "r", encoding='utf-8') as f:
+        data_chunks = [line.strip() for line in f if line.strip()]
+
+    if args.limit and args.limit > 0:
+        data_chunks = data_chunks[:args.limit]
+
+    if not data_chunks:
+        print(f"Error: No chunks found in {args.chunks}")
+        sys.exit(1)
+
+    report = check_encoder_parity(data_chunks, threads=args.threads, cache_dir=args.cache_dir)
+
+    speedup = report["fp32_seconds"] / report["int8_seconds"] if report["int8_seconds"] > 0 else 0
+    print(f"\nEncoder parity over {report['count']} chunks")
+    print("=" * 80)
+    print(f"Cosine drift (1 - cosine): mean {report['mean_drift']:.5f}, "
+          f"p95 {report['p95_drift']:.5f}, max {report['max_drift']:.5f}")
+    print(f"Encode time: fp32 {report['fp32_seconds']:.2f}s, int8 {report['int8_seconds']:.2f}s "
+          f"({speedup:.1f}x speedup)")
+    print("=" * 80)
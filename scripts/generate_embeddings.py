@@ -1,12 +1,17 @@
 from dotenv import load_dotenv
 import os
-from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone
 import sys
 from tqdm import tqdm
 import time
 import argparse
 import concurrent.futures
+import random
+from embedding_utils import (
+    DEFAULT_PROJECTION_PATH, PROJECTION_METHODS, VECTOR_DTYPES, ENCODER_MODES,
+    load_encoder, fit_projection, apply_projection, save_projection, load_projection, save_local_index
+)
+from adaptive_upsert import AdaptiveController, ControlledIndex, SimulatedIndex
 
 load_dotenv()  # Load environment variables from .env
 
@@ -15,15 +20,15 @@ def process_batch(batch_data):
     Process a single batch of data
 
     Args:
-        batch_data: Tuple of (start_idx, batch, model, index)
+        batch_data: Tuple of (start_idx, batch, model, index, projection)
 
     Returns:
-        Number of vectors processed
+        List of (vector_id, values, metadata) tuples that were processed
     """
-    start_idx, batch, model, index = batch_data
+    start_idx, batch, model, index, projection = batch_data
 
     # Generate embeddings
-    embeddings = model.encode(batch)
+    embeddings = apply_projection(model.encode(batch), projection)
 
     # Prepare vectors for upsert
     vectors = []
@@ -38,11 +43,97 @@ def process_batch(batch_data):
         vectors.append((vector_id, embedding.tolist(), metadata))
 
     # Upsert to Pinecone
-    index.upsert(vectors=vectors)
+    if index is not None:
+        index.upsert(vectors=vectors)
 
-    return len(vectors)
+    return vectors
 
-def generate_and_upsert_embeddings(data_chunks, batch_size=20, workers=1, use_parallel=False):
+def make_batches(data_chunks, batch_size, model, index, projection):
+    """Split chunks into fixed-size batch_data tuples for process_batch"""
+    batches = []
+    for i in range(0, len(data_chunks), batch_size):
+        batch = data_chunks[i:i+batch_size]
+        batches.append((i, batch, model, index, projection))
+    return batches
+
+def prepare_projection(model, data_chunks, target_dim=None, method="pca",
+                       projection_path=None, sample_size=2000):
+    """
+    Fit (or load) the projection applied to every embedding
+
+    If target_dim is given, a projection is fit on a sample of the corpus and
+    saved to projection_path so query_knowledge_base.py can apply the same one.
+    Otherwise an existing projection is loaded from projection_path, if set.
+    """
+    if target_dim:
+        projection_path = projection_path or DEFAULT_PROJECTION_PATH
+        sample = data_chunks
+        if len(data_chunks) > sample_size:
+            sample = random.Random(0).sample(data_chunks, sample_size)
+
+        print(f"Fitting {method} projection to {target_dim} dimensions on {len(sample)} chunks")
+        projection = fit_projection(model.encode(sample), target_dim, method=method)
+        save_projection(projection, projection_path)
+        print(f"Saved projection to {projection_path}")
+        return projection
+
+    if projection_path:
+        if not os.path.exists(projection_path):
+            print(f"Error: Projection file {projection_path} not found.")
+            sys.exit(1)
+        print(f"Using projection from {projection_path}")
+        return load_projection(projection_path)
+
+    return None
+
+def process_batches_adaptive(data_chunks, model, index, projection, controller, pbar, keep_vectors=False):
+    """
+    Process batches with in-flight requests and batch size set by a controller
+
+    New batches are submitted as earlier ones complete, each using the
+    controller's current batch size, with at most controller.workers in flight.
+
+    Args:
+        keep_vectors: Keep the vectors (e.g. for a local index); otherwise only count them
+
+    Returns:
+        Tuple of (number of vectors processed, dictionary mapping each batch's
+        start index to its vectors, empty unless keep_vectors is set)
+    """
+    total_vectors = 0
+    results = {}
+    pending = {}
+    position = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=controller.max_workers) as executor:
+        while position < len(data_chunks) or pending:
+            # Top up to the current concurrency limit
+            while position < len(data_chunks) and len(pending) < controller.workers:
+                batch = data_chunks[position:position+controller.batch_size]
+                batch_data = (position, batch, model, index, projection)
+                pending[executor.submit(process_batch, batch_data)] = batch_data
+                position += len(batch)
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                start_idx, batch = pending.pop(future)[:2]
+                try:
+                    vectors = future.result()
+                    total_vectors += len(vectors)
+                    if keep_vectors:
+                        results[start_idx] = vectors
+                except Exception as exc:
+                    pbar.write(f"Batch processing generated an exception: {exc}")
+                pbar.update(len(batch))
+
+    return total_vectors, results
+
+def generate_and_upsert_embeddings(data_chunks, batch_size=20, workers=1, use_parallel=False,
+                                   target_dim=None, projection_method="pca",
+                                   projection_path=None, projection_sample=2000,
+                                   local_index_path=None, local_dtype="float32",
+                                   use_pinecone=True, encoder_mode="fp32", threads=None,
+                                   controller=None, simulated_index=None):
     """
     Generate embeddings and upsert them to Pinecone
 
@@ -51,44 +142,80 @@ def generate_and_upsert_embeddings(data_chunks, batch_size=20, workers=1, use_pa
         batch_size: Size of batches to process at once
         workers: Number of parallel workers (only used if use_parallel=True)
         use_parallel: Whether to use parallel processing
+        target_dim: Reduce embeddings to this many dimensions (default: no reduction)
+        projection_method: "pca" or "truncate"
+        projection_path: Where the projection is saved to / loaded from
+        projection_sample: Number of chunks used to fit the projection
+        local_index_path: Also save the vectors to this local .npz index
+        local_dtype: Storage dtype of the local index (float32, float16 or int8)
+        use_pinecone: Whether to upsert the vectors to Pinecone
+        encoder_mode: "fp32" or "int8" (quantized CPU encoder)
+        threads: Number of intra-op threads for the encoder
+        controller: AdaptiveController that tunes workers and batch size on the fly
+                    (workers, batch_size and use_parallel are ignored when set)
+        simulated_index: Upsert to this local stand-in (e.g. a SimulatedIndex) instead of Pinecone
     """
-    if use_parallel:
+    if controller:
+        print(f"Processing {len(data_chunks)} chunks with adaptive concurrency "
+              f"(starting at {controller.workers} workers, batch size {controller.batch_size})")
+    elif use_parallel:
         print(f"Processing {len(data_chunks)} chunks with batch size {batch_size} using {workers} workers")
     else:
         print(f"Processing {len(data_chunks)} chunks with batch size {batch_size} (sequential processing)")
 
     # Load the model
-    # model = SentenceTransformer('all-MiniLM-L6-v2')
+    model = load_encoder(encoder_mode, threads=threads)
 
-    model = SentenceTransformer('all-mpnet-bsase-v2')  # 768 dimensions
-    pinecone_api_key = os.getenv("PINECONE_API_KEY")
+    index = None
+    if use_pinecone and simulated_index is None:
+        pinecone_api_key = os.getenv("PINECONE_API_KEY")
 
-    if not pinecone_api_key:
-        print("Error: Please check your .env file for PINECONE_API_KEY.")
-        sys.exit(1)
+        if not pinecone_api_key:
+            print("Error: Please check your .env file for PINECONE_API_KEY.")
+            sys.exit(1)
 
-    # Initialize Pinecone
-    pc = Pinecone(api_key=pinecone_api_key)
-    index_name = "poc-file-kb"
+        # Initialize Pinecone
+        pc = Pinecone(api_key=pinecone_api_key)
+        index_name = "poc-file-kb"
 
     try:
-        # Get the index
-        index = pc.Index(index_name)
+        if simulated_index is not None:
+            # Local stand-in that injects latency and throttling
+            index = simulated_index
+        elif use_pinecone:
+            # Get the index
+            index = pc.Index(index_name)
+
+        if index is not None:
+            # Retry throttled upserts instead of dropping them, and report
+            # every upsert to the adaptive controller if there is one
+            index = ControlledIndex(index, controller)
+
+        projection = prepare_projection(
+            model, data_chunks,
+            target_dim=target_dim,
+            method=projection_method,
+            projection_path=projection_path,
+            sample_size=projection_sample
+        )
 
         # Process data in batches
         total_vectors = 0
-        total_batches = (len(data_chunks) + batch_size - 1) // batch_size
         start_time = time.time()
-
-        if use_parallel and workers > 1:
-            # Prepare batches for parallel processing
-            batches = []
-            for i in range(0, len(data_chunks), batch_size):
-                batch = data_chunks[i:i+batch_size]
-                batches.append((i, batch, model, index))
-
+        local_vectors = {}
+
+        if controller:
+            # Adaptive processing
+            with tqdm(total=len(data_chunks), desc="Processing chunks", unit="chunk") as pbar:
+                total_vectors, local_vectors = process_batches_adaptive(
+                    data_chunks, model, index, projection, controller, pbar,
+                    keep_vectors=bool(local_index_path)
+                )
+            print(controller.summary())
+        elif use_parallel and workers > 1:
             # Process batches in parallel
-            with tqdm(total=total_batches, desc="Processing batches") as pbar:
+            batches = make_batches(data_chunks, batch_size, model, index, projection)
+            with tqdm(total=len(batches), desc="Processing batches") as pbar:
                 with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
                     # Submit all batch processing tasks
                     future_to_batch = {executor.submit(process_batch, batch_data): batch_data for batch_data in batches}
@@ -96,35 +223,22 @@ def generate_and_upsert_embeddings(data_chunks, batch_size=20, workers=1, use_pa
                     # Process results as they complete
                     for future in concurrent.futures.as_completed(future_to_batch):
                         try:
-                            vectors_processed = future.result()
-                            total_vectors += vectors_processed
+                            vectors = future.result()
+                            total_vectors += len(vectors)
+                            if local_index_path:
+                                local_vectors[future_to_batch[future][0]] = vectors
                             pbar.update(1)
                         except Exception as exc:
                             print(f"Batch processing generated an exception: {exc}")
         else:
             # Sequential processing
-            with tqdm(total=total_batches, desc="Processing batches") as pbar:
-                for i in range(0, len(data_chunks), batch_size):
-                    batch = data_chunks[i:i+batch_size]
-
-                    # Generate embeddings
-                    embeddings = model.encode(batch)
-
-                    # Prepare vectors for upsert
-                    vectors = []
-                    for j, embedding in enumerate(embeddings):
-                        # Create a unique ID for each vector
-                        vector_id = f"chunk-{i+j}"
-
-                        # Store the text as metadata
-                        metadata = {"text": batch[j]}
-
-                        # Add to vectors list
-                        vectors.append((vector_id, embedding.tolist(), metadata))
-
-                    # Upsert to Pinecone
-                    index.upsert(vectors=vectors)
+            batches = make_batches(data_chunks, batch_size, model, index, projection)
+            with tqdm(total=len(batches), desc="Processing batches") as pbar:
+                for batch_data in batches:
+                    vectors = process_batch(batch_data)
                     total_vectors += len(vectors)
+                    if local_index_path:
+                        local_vectors[batch_data[0]] = vectors
 
                     # Update progress bar
                     pbar.update(1)
@@ -134,14 +248,33 @@ def generate_and_upsert_embeddings(data_chunks, batch_size=20, workers=1, use_pa
         vectors_per_second = total_vectors / elapsed_time if elapsed_time > 0 else 0
 
         # Get final stats
-        print(f"Successfully loaded {total_vectors} vectors into Pinecone in {elapsed_time:.2f} seconds")
+        if simulated_index is not None:
+            destination = "the simulated index"
+        elif use_pinecone:
+            destination = "Pinecone"
+        else:
+            destination = "the local index"
+        print(f"Successfully loaded {total_vectors} vectors into {destination} in {elapsed_time:.2f} seconds")
         print(f"Processing speed: {vectors_per_second:.2f} vectors/second")
 
-        try:
-            stats = index.describe_index_stats()
-            print(f"Index stats: {stats['total_vector_count']} total vectors")
-        except Exception as e:
-            print(f"Could not get index stats: {e}")
+        if local_index_path and local_vectors:
+            ordered = [v for start_idx in sorted(local_vectors) for v in local_vectors[start_idx]]
+            save_local_index(
+                local_index_path,
+                ids=[v[0] for v in ordered],
+                texts=[v[2]["text"] for v in ordered],
+                vectors=[v[1] for v in ordered],
+                dtype=local_dtype,
+                projection=projection
+            )
+            print(f"Saved {len(ordered)} {local_dtype} vectors to local index {local_index_path}")
+
+        if index is not None:
+            try:
+                stats = index.describe_index_stats()
+                print(f"Index stats: {stats['total_vector_count']} total vectors")
+            except Exception as e:
+                print(f"Could not get index stats: {e}")
 
     except Exception as e:
         print(f"Error: {e}")
@@ -159,12 +292,58 @@ def parse_arguments():
                         help='Use parallel processing (default: False)')
     parser.add_argument('--limit', type=int, default=None,
                         help='Limit the number of chunks to process (default: process all)')
+    parser.add_argument('--target-dim', type=int, default=None,
+                        help='Reduce embeddings to this many dimensions (default: no reduction)')
+    parser.add_argument('--projection-method', choices=PROJECTION_METHODS, default='pca',
+                        help='How to reduce dimensions: pca or truncate (default: pca)')
+    parser.add_argument('--projection', default=None,
+                        help=f'Projection file to save to / load from (default: {DEFAULT_PROJECTION_PATH} when --target-dim is set)')
+    parser.add_argument('--projection-sample', type=int, default=2000,
+                        help='Number of chunks used to fit the projection (default: 2000)')
+    parser.add_argument('--local-index', default=None,
+                        help='Also save the vectors to this local .npz index')
+    parser.add_argument('--local-dtype', choices=VECTOR_DTYPES, default='float32',
+                        help='Storage dtype for the local index (default: float32)')
+    parser.add_argument('--no-pinecone', action='store_true',
+                        help='Skip Pinecone and only build the local index')
+    parser.add_argument('--encoder', choices=ENCODER_MODES, default='fp32',
+                        help='Encoder mode: fp32 or int8 (quantized, CPU) (default: fp32)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Number of intra-op threads for the encoder (default: torch default)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Tune workers and batch size on the fly from upsert latency and throttling')
+    parser.add_argument('--min-workers', type=int, default=1,
+                        help='Lower bound on workers with --adaptive (default: 1)')
+    parser.add_argument('--max-workers', type=int, default=16,
+                        help='Upper bound on workers with --adaptive (default: 16)')
+    parser.add_argument('--min-batch-size', type=int, default=5,
+                        help='Lower bound on batch size with --adaptive (default: 5)')
+    parser.add_argument('--max-batch-size', type=int, default=200,
+                        help='Upper bound on batch size with --adaptive (default: 200)')
+    parser.add_argument('--target-latency', type=float, default=1.0,
+                        help='Upsert latency in seconds above which --adaptive backs off (default: 1.0)')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Upsert to a local stand-in that injects latency and throttling instead of Pinecone')
+    parser.add_argument('--simulate-latency', type=float, default=0.05,
+                        help='Base upsert latency in seconds for --simulate (default: 0.05)')
+    parser.add_argument('--simulate-capacity', type=int, default=4,
+                        help='In-flight upserts --simulate accepts before throttling (default: 4)')
+    parser.add_argument('--simulate-throttle-rate', type=float, default=0.02,
+                        help='Fraction of --simulate upserts throttled at random (default: 0.02)')
     return parser.parse_args()
 
 if __name__ == "__main__":
     # Parse command line arguments
     args = parse_arguments()
 
+    if args.no_pinecone and args.simulate:
+        print("Error: --simulate cannot be combined with --no-pinecone")
+        sys.exit(1)
+
+    if args.no_pinecone and not args.local_index:
+        print("Error: --no-pinecone requires --local-index")
+        sys.exit(1)
+
     # Load data chunks
     with open("temp_chunks.txt", "r", encoding='utf-8') as f:
         data_chunks = [line.strip() for line in f if line.strip()]
@@ -176,10 +355,38 @@ if __name__ == "__main__":
 
     print(f"Loaded {len(data_chunks)} chunks from temp_chunks.txt")
 
+    controller = None
+    if args.adaptive:
+        controller = AdaptiveController(
+            workers=args.workers,
+            batch_size=args.batch_size,
+            min_workers=args.min_workers,
+            max_workers=args.max_workers,
+            min_batch_size=args.min_batch_size,
+            max_batch_size=args.max_batch_size,
+            target_latency=args.target_latency,
+            log=tqdm.write
+        )
+
     # Run the embedding generation
     generate_and_upsert_embeddings(
         data_chunks,
         batch_size=args.batch_size,
         workers=args.workers,
-        use_parallel=args.parallel
+        use_parallel=args.parallel,
+        target_dim=args.target_dim,
+        projection_method=args.projection_method,
+        projection_path=args.projection,
+        projection_sample=args.projection_sample,
+        local_index_path=args.local_index,
+        local_dtype=args.local_dtype,
+        use_pinecone=not args.no_pinecone,
+        encoder_mode=args.encoder,
+        threads=args.threads,
+        controller=controller,
+        simulated_index=SimulatedIndex(
+            base_latency=args.simulate_latency,
+            capacity=args.simulate_capacity,
+            throttle_rate=args.simulate_throttle_rate
+        ) if args.simulate else None
     )
@@ -2,6 +2,10 @@ import os
 import sys
 from pathlib import Path
 import re
+import csv
+import hashlib
+import argparse
+import concurrent.futures
 
 # Import document processing libraries
 try:
@@ -20,18 +24,55 @@ except ImportError:
     print("Warning: python-docx package not available. DOCX processing will be limited.")
     print("To install: pip install python-docx")
 
-def clean_text(text):
-    """Clean text by removing extra whitespace and non-printable characters"""
-    if not text:
-        return ""
+try:
+    import pytesseract
+    from PIL import Image
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+    print("Warning: pytesseract/Pillow packages not available. Image OCR will be disabled.")
+    print("To install: pip install pytesseract pillow (and the tesseract binary)")
 
+try:
+    from pdf2image import convert_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+    print("Warning: pdf2image package not available. Scanned PDF pages will not be OCR'd.")
+    print("To install: pip install pdf2image (and poppler)")
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.gif']
+
+# Default OCR settings
+DEFAULT_OCR_DPI = 300
+DEFAULT_OCR_CACHE_DIR = ".ocr_cache"
+
+# Number of characters read at a time when streaming text files
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Allow large CSV fields (the csv module's default limit is 128 KB)
+try:
+    CSV_FIELD_SIZE_LIMIT = sys.maxsize
+    csv.field_size_limit(CSV_FIELD_SIZE_LIMIT)
+except OverflowError:
+    # sys.maxsize does not fit in a C long on some platforms
+    CSV_FIELD_SIZE_LIMIT = 2 ** 31 - 1
+    csv.field_size_limit(CSV_FIELD_SIZE_LIMIT)
+
+def _clean_block(text):
+    """Same as clean_text, but keeps leading/trailing spaces so blocks can be joined"""
     # Replace multiple whitespace with a single space
     text = re.sub(r'\s+', ' ', text)
 
     # Remove non-printable characters
-    text = ''.join(c if ord(c) >= 32 or c in '\n\r\t' else ' ' for c in text)
+    return ''.join(c if ord(c) >= 32 or c in '\n\r\t' else ' ' for c in text)
+
+def clean_text(text):
+    """Clean text by removing extra whitespace and non-printable characters"""
+    if not text:
+        return ""
 
-    return text.strip()
+    return _clean_block(text).strip()
 
 def chunk_text(text, min_length=50, max_length=1000):
     """Split text into reasonable chunks"""
@@ -69,34 +110,351 @@ def chunk_text(text, min_length=50, max_length=1000):
 
     return chunks
 
+def _split_long_sentence(sentence, max_length):
+    """Split a sentence longer than max_length at the last space (or hard cut)"""
+    pieces = []
+    while len(sentence) > max_length:
+        cut = sentence.rfind(' ', 0, max_length)
+        if cut <= 0:
+            cut = max_length
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:].lstrip()
+    pieces.append(sentence)
+    return pieces
+
+def iter_text_chunks(blocks, min_length=50, max_length=1000):
+    """
+    Incremental version of chunk_text for text that arrives in blocks
+
+    Only the current chunk and the unfinished trailing sentence are kept in
+    memory, so memory use does not depend on the total size of the text.
+    Sentences longer than max_length are split at the last space (or hard cut)
+    to keep that bound even for text without sentence punctuation. Like
+    chunk_text, text shorter than max_length is returned as a single chunk.
+
+    Args:
+        blocks: Iterable of cleaned text blocks
+        min_length: Minimum chunk length
+        max_length: Maximum chunk length
+
+    Yields:
+        Text chunks
+    """
+    current_chunk = ""
+    pending = ""
+    # Start of the text, kept until it grows past max_length (plus room for
+    # one leading and one trailing space)
+    head = ""
+
+    def add_sentence(sentence):
+        nonlocal current_chunk
+        if not sentence.strip():
+            return None
+        # If adding this sentence would make the chunk too long, start a new chunk
+        if len(current_chunk) + len(sentence) > max_length and len(current_chunk) >= min_length:
+            finished = current_chunk.strip()
+            current_chunk = sentence
+            return finished
+        if current_chunk:
+            current_chunk += " " + sentence
+        else:
+            current_chunk = sentence
+        return None
+
+    for block in blocks:
+        if head is not None:
+            head += block
+            if len(head) > max_length + 2:
+                head = None
+
+        pending += block
+        sentences = re.split(r'(?<=[.!?])\s+', pending)
+        # The last piece may continue in the next block; keep only its tail
+        # that still fits under max_length
+        tail = _split_long_sentence(sentences.pop(), max_length)
+        pending = tail.pop()
+        sentences.extend(tail)
+
+        for sentence in sentences:
+            for piece in _split_long_sentence(sentence.strip(), max_length):
+                finished = add_sentence(piece)
+                if finished:
+                    yield finished
+
+    if head is not None and len(head.strip()) < max_length:
+        # Short text: nothing has been yielded yet, so return it whole
+        if len(head.strip()) >= min_length:
+            yield head.strip()
+        return
+
+    finished = add_sentence(pending.strip())
+    if finished:
+        yield finished
+
+    # Add the last chunk if it's not empty
+    if current_chunk and len(current_chunk.strip()) >= min_length:
+        yield current_chunk.strip()
+
+def _read_blocks(f, block_size=STREAM_BLOCK_SIZE):
+    """
+    Read a text file in fixed-size blocks, cleaning each one
+
+    A whitespace run split across two blocks is collapsed to a single space,
+    so the output does not depend on block_size.
+    """
+    previous_ended_in_space = False
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+
+        cleaned = _clean_block(block)
+        if previous_ended_in_space and block[0].isspace():
+            # The previous block already emitted the space for this run
+            cleaned = cleaned[1:]
+        previous_ended_in_space = block[-1].isspace()
+        yield cleaned
+
 def process_text_file(filepath):
-    """Process a plain text file"""
+    """Process a plain text file, streaming it in blocks"""
     try:
         with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-            content = clean_text(content)
-            return chunk_text(content)
+            yield from iter_text_chunks(_read_blocks(f))
     except Exception as e:
         print(f"Error processing text file {filepath}: {e}")
-        return []
 
-def process_pdf_file(filepath):
-    """Process a PDF file"""
+def _format_csv_row(row):
+    """Render a CSV row as a single cleaned line"""
+    return clean_text(", ".join(row))
+
+def process_csv_file(filepath, max_length=1000):
+    """
+    Process a CSV file row by row
+
+    Rows are grouped into chunks of up to max_length characters, and every
+    chunk starts with the header row so it can be understood on its own.
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8', errors='ignore', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            header_line = _format_csv_row(header)
+
+            rows = []
+            size = len(header_line)
+            for row in reader:
+                row_line = _format_csv_row(row)
+                if not row_line:
+                    continue
+
+                # Flush the current group if this row would exceed the budget
+                if rows and size + len(row_line) + 3 > max_length:
+                    yield " | ".join([header_line] + rows)
+                    rows = []
+                    size = len(header_line)
+
+                rows.append(row_line)
+                size += len(row_line) + 3
+
+            if rows:
+                yield " | ".join([header_line] + rows)
+    except Exception as e:
+        print(f"Error processing CSV file {filepath}: {e}")
+
+def _ocr_image_file(filepath, lang="eng"):
+    """OCR a single image file (runs inside a worker process)"""
+    with Image.open(filepath) as image:
+        return pytesseract.image_to_string(image, lang=lang)
+
+def _ocr_pdf_page(filepath, page_num, dpi, lang="eng"):
+    """Render a single (0-based) PDF page and OCR it (runs inside a worker process)"""
+    pages = convert_from_path(filepath, dpi=dpi, first_page=page_num + 1, last_page=page_num + 1)
+    return pytesseract.image_to_string(pages[0], lang=lang)
+
+def _file_sha256(filepath, block_size=STREAM_BLOCK_SIZE):
+    """Hash a file's contents without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _ocr_cache_path(cache_dir, key, lang):
+    """Build the cache file path for an OCR result"""
+    return os.path.join(cache_dir, f"{key}.{lang}.txt")
+
+def _run_ocr_jobs(jobs, cache_dir=DEFAULT_OCR_CACHE_DIR, workers=None, lang="eng"):
+    """
+    Run OCR jobs in a process pool, skipping any whose result is cached
+
+    Args:
+        jobs: List of (cache_key, function, args) tuples; function(*args)
+              returns the OCR text and must be picklable
+        cache_dir: Directory for cached OCR results (None disables caching)
+        workers: Number of OCR worker processes (default: CPU count)
+        lang: Tesseract language code, part of the cache key
+
+    Returns:
+        List of extracted texts, in the same order as jobs
+    """
+    texts = [None] * len(jobs)
+
+    # Group jobs by cache key so duplicate work (e.g. the same image twice) runs once
+    key_to_indices = {}
+    for i, (key, _, _) in enumerate(jobs):
+        key_to_indices.setdefault(key, []).append(i)
+
+    # Reuse cached results for work we have already done
+    pending = []
+    for key, indices in key_to_indices.items():
+        if cache_dir:
+            cache_path = _ocr_cache_path(cache_dir, key, lang)
+            if os.path.exists(cache_path):
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                for i in indices:
+                    texts[i] = text
+                continue
+        pending.append(key)
+
+    if not pending:
+        return texts
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Run the expensive OCR passes in parallel
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        future_to_key = {}
+        for key in pending:
+            _, func, args = jobs[key_to_indices[key][0]]
+            future_to_key[executor.submit(func, *args)] = key
+
+        for future in concurrent.futures.as_completed(future_to_key):
+            key = future_to_key[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                print(f"OCR failed for {key}: {e}")
+                text = ""
+            else:
+                if cache_dir:
+                    # Write atomically so an interrupted run never leaves a partial entry
+                    cache_path = _ocr_cache_path(cache_dir, key, lang)
+                    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                    os.replace(tmp_path, cache_path)
+
+            for i in key_to_indices[key]:
+                texts[i] = text
+
+    return texts
+
+def ocr_image_files(filepaths, cache_dir=DEFAULT_OCR_CACHE_DIR, workers=None, lang="eng"):
+    """
+    OCR a list of image files, using a process pool and an on-disk cache
+
+    Results are cached by the sha256 of each file's contents. Files are hashed
+    by streaming them, and workers only read a file on a cache miss.
+
+    Args:
+        filepaths: List of image file paths (PNG, JPEG, ...)
+        cache_dir: Directory for cached OCR results (None disables caching)
+        workers: Number of OCR worker processes (default: CPU count)
+        lang: Tesseract language code
+
+    Returns:
+        List of extracted texts, in the same order as filepaths
+    """
+    if not OCR_AVAILABLE:
+        return ["" for _ in filepaths]
+
+    jobs = [
+        (_file_sha256(filepath), _ocr_image_file, (filepath, lang))
+        for filepath in filepaths
+    ]
+    return _run_ocr_jobs(jobs, cache_dir=cache_dir, workers=workers, lang=lang)
+
+def ocr_pdf_pages(filepath, page_numbers, dpi=DEFAULT_OCR_DPI, cache_dir=DEFAULT_OCR_CACHE_DIR,
+                  workers=None, lang="eng"):
+    """
+    OCR (0-based) pages of a PDF, using a process pool and an on-disk cache
+
+    Results are cached by the PDF's sha256, page number and DPI, so pages of
+    an unchanged file are neither rendered nor OCR'd again. Cache misses are
+    rendered inside the worker processes.
+
+    Returns:
+        List of extracted texts, in the same order as page_numbers
+    """
+    if not (OCR_AVAILABLE and PDF2IMAGE_AVAILABLE):
+        return ["" for _ in page_numbers]
+
+    digest = _file_sha256(filepath)
+    jobs = [
+        (f"{digest}-p{page_num}-{dpi}dpi", _ocr_pdf_page, (filepath, page_num, dpi, lang))
+        for page_num in page_numbers
+    ]
+    return _run_ocr_jobs(jobs, cache_dir=cache_dir, workers=workers, lang=lang)
+
+def process_image_file(filepath, ocr_workers=None, ocr_cache_dir=DEFAULT_OCR_CACHE_DIR, ocr_text=None):
+    """
+    Process an image file with OCR
+
+    If ocr_text is given (already OCR'd in a batch), it is used directly.
+    """
+    if OCR_AVAILABLE:
+        try:
+            if ocr_text is None:
+                ocr_text = ocr_image_files([filepath], cache_dir=ocr_cache_dir, workers=ocr_workers)[0]
+
+            return chunk_text(clean_text(ocr_text))
+        except Exception as e:
+            print(f"Error processing image {filepath}: {e}")
+            return []
+    return ["[Image content not extracted - pytesseract not available]"]
+
+def process_pdf_file(filepath, ocr_dpi=DEFAULT_OCR_DPI, ocr_max_pages=None,
+                     ocr_workers=None, ocr_cache_dir=DEFAULT_OCR_CACHE_DIR):
+    """
+    Process a PDF file
+
+    Pages without a text layer (scanned pages) are rendered at ocr_dpi and
+    OCR'd, up to ocr_max_pages pages per document.
+    """
     if PYPDF_AVAILABLE:
         chunks = []
         try:
             with open(filepath, 'rb') as f:
                 pdf = pypdf.PdfReader(f)
-                full_text = ""
+                page_texts = []
 
                 for page_num in range(len(pdf.pages)):
                     page = pdf.pages[page_num]
                     text = page.extract_text()
-                    if text:
-                        full_text += text + "\n\n"
+                    page_texts.append(text if text and text.strip() else "")
 
-                full_text = clean_text(full_text)
-                return chunk_text(full_text)
+            # OCR pages that have no text layer
+            scanned_pages = [i for i, text in enumerate(page_texts) if not text]
+            if scanned_pages and OCR_AVAILABLE and PDF2IMAGE_AVAILABLE:
+                if ocr_max_pages is not None:
+                    scanned_pages = scanned_pages[:ocr_max_pages]
+                ocr_texts = ocr_pdf_pages(
+                    filepath, scanned_pages, dpi=ocr_dpi, cache_dir=ocr_cache_dir, workers=ocr_workers
+                )
+                for page_num, text in zip(scanned_pages, ocr_texts):
+                    page_texts[page_num] = text
+
+            full_text = ""
+            for text in page_texts:
+                if text:
+                    full_text += text + "\n\n"
+
+            full_text = clean_text(full_text)
+            return chunk_text(full_text)
         except Exception as e:
             print(f"Error processing PDF {filepath}: {e}")
             return []
@@ -120,9 +478,22 @@ def process_docx_file(filepath):
             return []
     return ["[DOCX content not extracted - python-docx not available]"]
 
-def load_and_chunk_documents(directory):
-    """Load and chunk documents from a directory"""
-    chunks = []
+def iter_document_chunks(directory, ocr_dpi=DEFAULT_OCR_DPI, ocr_max_pages=None,
+                         ocr_workers=None, ocr_cache_dir=DEFAULT_OCR_CACHE_DIR):
+    """Load and chunk documents from a directory, yielding chunks as they are produced"""
+    # OCR all images up front so they share one process pool; the per-file
+    # pass below then uses these results.
+    image_paths = [
+        os.path.join(directory, filename) for filename in os.listdir(directory)
+        if Path(filename).suffix.lower() in IMAGE_EXTENSIONS
+        and os.path.isfile(os.path.join(directory, filename))
+    ]
+    image_texts = {}
+    if OCR_AVAILABLE and image_paths:
+        print(f"Running OCR on {len(image_paths)} images...")
+        texts = ocr_image_files(image_paths, cache_dir=ocr_cache_dir, workers=ocr_workers)
+        image_texts = dict(zip(image_paths, texts))
+
     for filename in os.listdir(directory):
         filepath = os.path.join(directory, filename)
         if os.path.isfile(filepath):
@@ -130,46 +501,88 @@ def load_and_chunk_documents(directory):
 
             try:
                 # Process based on file type
-                if file_ext in ['.txt', '.md', '.csv']:
+                if file_ext in ['.txt', '.md']:
                     # Text files
                     file_chunks = process_text_file(filepath)
+                elif file_ext == '.csv':
+                    # CSV files
+                    file_chunks = process_csv_file(filepath)
                 elif file_ext == '.pdf':
                     # PDF files
-                    file_chunks = process_pdf_file(filepath)
+                    file_chunks = process_pdf_file(
+                        filepath,
+                        ocr_dpi=ocr_dpi,
+                        ocr_max_pages=ocr_max_pages,
+                        ocr_workers=ocr_workers,
+                        ocr_cache_dir=ocr_cache_dir
+                    )
                 elif file_ext in ['.docx', '.doc']:
                     # Word documents
                     file_chunks = process_docx_file(filepath)
+                elif file_ext in IMAGE_EXTENSIONS:
+                    # Images
+                    file_chunks = process_image_file(
+                        filepath,
+                        ocr_workers=ocr_workers,
+                        ocr_cache_dir=ocr_cache_dir,
+                        ocr_text=image_texts.get(filepath)
+                    )
                 else:
                     print(f"Skipping unsupported file type: {filename}")
                     file_chunks = []
 
                 # Add non-empty chunks with source information
-                valid_chunks = []
+                valid_chunks = 0
                 for chunk in file_chunks:
                     if chunk and len(chunk.strip()) > 20:
                         # Add source information to the chunk
-                        chunk_with_source = f"{chunk.strip()} [Source: {filename}]"
-                        valid_chunks.append(chunk_with_source)
+                        yield f"{chunk.strip()} [Source: {filename}]"
+                        valid_chunks += 1
 
-                chunks.extend(valid_chunks)
-                print(f"Processed: {filename} - Found {len(valid_chunks)} chunks.")
+                print(f"Processed: {filename} - Found {valid_chunks} chunks.")
             except Exception as e:
                 print(f"Error processing {filename}: {e}")
 
-    return chunks
+def load_and_chunk_documents(directory, **kwargs):
+    """Load and chunk documents from a directory"""
+    return list(iter_document_chunks(directory, **kwargs))
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Load and chunk documents from a directory')
+    parser.add_argument('directory',
+                        help='Directory containing the documents to process')
+    parser.add_argument('--ocr-dpi', type=int, default=DEFAULT_OCR_DPI,
+                        help=f'DPI used to render scanned PDF pages for OCR (default: {DEFAULT_OCR_DPI})')
+    parser.add_argument('--ocr-max-pages', type=int, default=None,
+                        help='Maximum number of scanned pages to OCR per PDF (default: all)')
+    parser.add_argument('--ocr-workers', type=int, default=None,
+                        help='Number of OCR worker processes (default: CPU count)')
+    parser.add_argument('--ocr-cache-dir', default=DEFAULT_OCR_CACHE_DIR,
+                        help=f'Directory for cached OCR results (default: {DEFAULT_OCR_CACHE_DIR})')
+    parser.add_argument('--no-ocr-cache', action='store_true',
+                        help='Disable the OCR result cache')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python load_and_chunk.py <directory_path>")
-        sys.exit(1)
+    # Parse command line arguments
+    args = parse_arguments()
 
-    documents_directory = sys.argv[1]
-    data_chunks = load_and_chunk_documents(documents_directory)
-    print(f"Total number of data chunks: {len(data_chunks)}")
+    data_chunks = iter_document_chunks(
+        args.directory,
+        ocr_dpi=args.ocr_dpi,
+        ocr_max_pages=args.ocr_max_pages,
+        ocr_workers=args.ocr_workers,
+        ocr_cache_dir=None if args.no_ocr_cache else args.ocr_cache_dir
+    )
 
-    # Save chunks to file
+    # Save chunks to file as they are produced
+    total_chunks = 0
     with open("temp_chunks.txt", "w", encoding='utf-8') as f:
         for chunk in data_chunks:
             # Ensure the chunk is a string and clean it
             if chunk and isinstance(chunk, str):
                 f.write(chunk + "\n")
+                total_chunks += 1
+
+    print(f"Total number of data chunks: {total_chunks}")
@@ -1,30 +1,42 @@
 from dotenv import load_dotenv
 import os
-from sentence_transformers import SentenceTransformer
 from pinecone import Pinecone
 import sys
 import textwrap
 import argparse
+from embedding_utils import (
+    ENCODER_MODES, DEFAULT_PROJECTION_PATH,
+    load_encoder, apply_projection, load_projection, load_local_index, query_local_index
+)
 
 load_dotenv()  # Load environment variables from .env
 
-def query_pinecone(query, top_k=5, threshold=0.0):
+def open_knowledge_base(projection_path=None, local_index_path=None, use_default_projection=True):
     """
-    Query the Pinecone index with a natural language query
+    Open the index to query and resolve the projection for query embeddings
+
+    Call once per session: the local index is loaded and the Pinecone index
+    dimension is looked up here, not on every query.
 
     Args:
-        query: The natural language query
-        top_k: Number of results to return
-        threshold: Minimum similarity score threshold (0.0 to 1.0)
+        projection_path: Projection file used when the embeddings were generated
+                         (default: the projection stored in the local index, or
+                         projection.npz for Pinecone if it matches the index dimension)
+        local_index_path: Query this local .npz index instead of Pinecone
+        use_default_projection: Fall back to projection.npz for Pinecone
+
+    Returns:
+        Dictionary with the index (or local index), its dimension and the projection
     """
-    print(f"\nQuerying knowledge base with: '{query}'")
-
-    # Load the model
-    # model = SentenceTransformer('all-MiniLM-L6-v2')
-    model = SentenceTransformer('all-mpnet-base-v2')  # 768 dimensions
-    
-    # Convert query to embedding
-    query_embedding = model.encode([query])[0].tolist()
+    if local_index_path:
+        local_index = load_local_index(local_index_path)
+        projection = load_projection(projection_path) if projection_path else local_index["projection"]
+        return {
+            "index": None,
+            "local_index": local_index,
+            "index_dim": local_index["vectors"].shape[1],
+            "projection": projection,
+        }
 
     # Get Pinecone API key
     pinecone_api_key = os.getenv("PINECONE_API_KEY")
@@ -35,17 +47,70 @@ def query_pinecone(query, top_k=5, threshold=0.0):
     # Initialize Pinecone
     pc = Pinecone(api_key=pinecone_api_key)
     index_name = "poc-file-kb"
+    index = pc.Index(index_name)
+    index_dim = index.describe_index_stats()["dimension"]
+
+    projection = None
+    if projection_path:
+        projection = load_projection(projection_path)
+    elif use_default_projection and os.path.exists(DEFAULT_PROJECTION_PATH):
+        # Only trust the default file if it matches the index; it may be left
+        # over from an earlier run with a different --target-dim
+        default_projection = load_projection(DEFAULT_PROJECTION_PATH)
+        if default_projection["target_dim"] == index_dim:
+            projection = default_projection
+        else:
+            print(f"Ignoring {DEFAULT_PROJECTION_PATH}: it reduces to {default_projection['target_dim']} "
+                  f"dimensions but the index has {index_dim}.")
 
-    try:
-        # Get the index
-        index = pc.Index(index_name)
+    return {
+        "index": index,
+        "local_index": None,
+        "index_dim": index_dim,
+        "projection": projection,
+    }
+
+def query_pinecone(query, top_k=5, threshold=0.0, knowledge_base=None, encoder_mode="fp32", threads=None):
+    """
+    Query the Pinecone index with a natural language query
 
-        # Query the index
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
+    Args:
+        query: The natural language query
+        top_k: Number of results to return
+        threshold: Minimum similarity score threshold (0.0 to 1.0)
+        knowledge_base: Index opened with open_knowledge_base (default: open Pinecone)
+        encoder_mode: "fp32" or "int8" (quantized CPU encoder)
+        threads: Number of intra-op threads for the encoder
+    """
+    print(f"\nQuerying knowledge base with: '{query}'")
+
+    # Load the model (cached after the first query)
+    model = load_encoder(encoder_mode, threads=threads)
+
+    try:
+        if knowledge_base is None:
+            knowledge_base = open_knowledge_base()
+        projection = knowledge_base["projection"]
+        index_dim = knowledge_base["index_dim"]
+
+        # Convert query to embedding, reduced the same way as the stored vectors
+        query_embedding = apply_projection(model.encode([query]), projection)[0]
+
+        if index_dim and len(query_embedding) != index_dim:
+            print(f"Error: Query embedding has {len(query_embedding)} dimensions but the index has {index_dim}.")
+            print("Pass the --projection file that was saved when the embeddings were generated.")
+            return
+
+        if knowledge_base["local_index"] is not None:
+            # Query the local index
+            results = query_local_index(knowledge_base["local_index"], query_embedding, top_k=top_k)
+        else:
+            # Query the index
+            results = knowledge_base["index"].query(
+                vector=query_embedding.tolist(),
+                top_k=top_k,
+                include_metadata=True
+            )
 
         # Filter results by threshold if specified
         filtered_matches = [
@@ -74,7 +139,7 @@ def query_pinecone(query, top_k=5, threshold=0.0):
             print(f"Try adjusting the threshold (current: {threshold}) or use a different query.")
 
     except Exception as e:
-        print(f"Error querying Pinecone: {e}")
+        print(f"Error querying knowledge base: {e}")
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -87,9 +152,20 @@ def parse_arguments():
                         help='Minimum similarity score threshold (default: 0.0)')
     parser.add_argument('--interactive', action='store_true',
                         help='Run in interactive mode')
+    parser.add_argument('--projection', default=None,
+                        help='Projection file used when generating the embeddings (default: stored in the '
+                             f'local index, or {DEFAULT_PROJECTION_PATH} if it matches the index dimension)')
+    parser.add_argument('--no-projection', action='store_true',
+                        help=f'Do not fall back to {DEFAULT_PROJECTION_PATH} when querying Pinecone')
+    parser.add_argument('--local-index', default=None,
+                        help='Query this local .npz index instead of Pinecone')
+    parser.add_argument('--encoder', choices=ENCODER_MODES, default='fp32',
+                        help='Encoder mode: fp32 or int8 (quantized, CPU) (default: fp32)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Number of intra-op threads for the encoder (default: torch default)')
     return parser.parse_args()
 
-def interactive_mode():
+def interactive_mode(knowledge_base, encoder_mode="fp32", threads=None):
     """Run in interactive mode"""
     print("\n=== Knowledge Base Query System (Interactive Mode) ===")
     print("Type 'exit' or 'quit' to end the session")
@@ -110,16 +186,28 @@ def interactive_mode():
             threshold = 0.0
 
         # Execute query
-        query_pinecone(query, top_k=top_k, threshold=threshold)
+        query_pinecone(query, top_k=top_k, threshold=threshold, knowledge_base=knowledge_base,
+                       encoder_mode=encoder_mode, threads=threads)
 
 if __name__ == "__main__":
     # Parse command line arguments
     args = parse_arguments()
 
+    if args.interactive or args.query:
+        # Open the index once for the whole session
+        try:
+            knowledge_base = open_knowledge_base(projection_path=args.projection,
+                                                 local_index_path=args.local_index,
+                                                 use_default_projection=not args.no_projection)
+        except Exception as e:
+            print(f"Error opening knowledge base: {e}")
+            sys.exit(1)
+
     if args.interactive:
-        interactive_mode()
+        interactive_mode(knowledge_base, encoder_mode=args.encoder, threads=args.threads)
     elif args.query:
-        query_pinecone(args.query, top_k=args.top_k, threshold=args.threshold)
+        query_pinecone(args.query, top_k=args.top_k, threshold=args.threshold,
+                       knowledge_base=knowledge_base, encoder_mode=args.encoder, threads=args.threads)
     else:
         print("Error: Please provide a query or use --interactive mode")
         print("Usage: python query_knowledge_base.py \"your search query\"")
@@ -0,0 +1,134 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from adaptive_upsert import AdaptiveController, ControlledIndex, SimulatedIndex
+
+
+class StubEncoder:
+    """Stands in for SentenceTransformer, recording the batch sizes it sees"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, batch):
+        np = pytest.importorskip("numpy")
+        self.batch_sizes.append(len(batch))
+        return np.ones((len(batch), 8), dtype=np.float32)
+
+
+class StubProgress:
+    def update(self, n):
+        pass
+
+    def write(self, message):
+        pass
+
+
+class StatusError(Exception):
+    """Error carrying an HTTP status, like the Pinecone client's API exceptions"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FailingIndex:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def upsert(self, vectors, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+def test_adaptive_upsert_against_simulated_index():
+    # generate_embeddings pulls in the full embedding stack
+    for module in ("numpy", "dotenv", "pinecone", "tqdm", "sentence_transformers"):
+        pytest.importorskip(module)
+    from generate_embeddings import process_batches_adaptive
+
+    observed = []
+    controller = AdaptiveController(
+        workers=1, batch_size=10, min_workers=1, max_workers=8,
+        min_batch_size=5, max_batch_size=40, target_latency=0.3,
+        log=lambda message: observed.append((controller.workers, controller.batch_size))
+    )
+    simulated = SimulatedIndex(base_latency=0.01, per_vector_latency=0.0005,
+                               capacity=4, throttle_rate=0.05)
+    index = ControlledIndex(simulated, controller, backoff=0.01)
+    encoder = StubEncoder()
+    chunks = [f"chunk {i}" for i in range(1000)]
+
+    total_vectors, results = process_batches_adaptive(chunks, encoder, index, None, controller, StubProgress())
+
+    # Every vector lands despite throttling, and none are kept without a local index
+    assert total_vectors == len(chunks)
+    assert results == {}
+    assert simulated.describe_index_stats()["total_vector_count"] == len(chunks)
+    assert controller.throttles > 0
+
+    # Workers and batch size stay within bounds throughout
+    observed.append((controller.workers, controller.batch_size))
+    for workers, batch_size in observed:
+        assert 1 <= workers <= 8
+        assert 5 <= batch_size <= 40
+    assert max(encoder.batch_sizes) <= 40
+
+
+def test_permanent_errors_are_not_retried():
+    controller = AdaptiveController(workers=4, batch_size=20, log=lambda message: None)
+    failing = FailingIndex(ValueError("Vector dimension 768 does not match the dimension of the index 256"))
+    index = ControlledIndex(failing, controller, backoff=0.01)
+
+    with pytest.raises(ValueError):
+        index.upsert(vectors=[("chunk-0", [0.0], {})])
+
+    assert failing.calls == 1
+    assert (controller.workers, controller.batch_size) == (4, 20)
+
+
+def test_throttles_are_retried_without_controller():
+    class ThrottledOnce(FailingIndex):
+        def upsert(self, vectors, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                raise self.error
+            return {"upserted_count": len(vectors)}
+
+    throttled = ThrottledOnce(StatusError(429, "Too Many Requests"))
+    index = ControlledIndex(throttled, backoff=0.01)
+
+    assert index.upsert(vectors=[("chunk-0", [0.0], {})]) == {"upserted_count": 1}
+    assert throttled.calls == 2
+
+
+def test_status_wins_over_message():
+    controller = AdaptiveController(workers=4, batch_size=20, log=lambda message: None)
+    failing = FailingIndex(StatusError(400, "Metadata size is 42960 bytes, id chunk-4291 exceeds limit"))
+    index = ControlledIndex(failing, controller, backoff=0.01)
+
+    with pytest.raises(StatusError):
+        index.upsert(vectors=[("chunk-4291", [0.0], {})])
+
+    assert failing.calls == 1
+    assert controller.throttles == 0
+
+
+def test_timeouts_are_retried():
+    class TimesOutOnce(FailingIndex):
+        def upsert(self, vectors, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                raise RuntimeError("upsert failed") from TimeoutError("read timed out")
+            return {"upserted_count": len(vectors)}
+
+    timing_out = TimesOutOnce(None)
+    index = ControlledIndex(timing_out, backoff=0.01)
+
+    assert index.upsert(vectors=[("chunk-0", [0.0], {})]) == {"upserted_count": 1}
+    assert timing_out.calls == 2
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+
+def test_int8_cache_hit_skips_fp32_load_and_quantization(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    import embedding_utils
+
+    loads = []
+
+    class TinyEncoder(torch.nn.Module):
+        """Stands in for SentenceTransformer, recording whether fp32 weights were loaded"""
+
+        def __init__(self, model_name, device=None, model_kwargs=None):
+            super().__init__()
+            skeleton = (model_kwargs or {}).get("state_dict") == {}
+            loads.append("skeleton" if skeleton else "fp32")
+            # Skeleton weights differ from the real ones, so a cache miss would show
+            torch.manual_seed(1 if skeleton else 0)
+            self.linear = torch.nn.Linear(16, 8)
+
+        def encode(self, texts):
+            with torch.no_grad():
+                return self.linear(torch.ones(len(texts), 16)).numpy()
+
+    quantize_calls = []
+    quantize_dynamic = torch.ao.quantization.quantize_dynamic
+
+    def counting_quantize_dynamic(*args, **kwargs):
+        quantize_calls.append(args)
+        return quantize_dynamic(*args, **kwargs)
+
+    monkeypatch.setattr(embedding_utils, "SentenceTransformer", TinyEncoder)
+    monkeypatch.setattr(torch.ao.quantization, "quantize_dynamic", counting_quantize_dynamic)
+    monkeypatch.setattr(embedding_utils, "_encoders", {})
+
+    converted = embedding_utils.load_encoder("int8", model_name="tiny", cache_dir=str(tmp_path), warmup=False)
+    assert loads == ["fp32"]
+    assert len(quantize_calls) == 1
+
+    # A fresh process: the cache hit builds a skeleton and never quantizes
+    monkeypatch.setattr(embedding_utils, "_encoders", {})
+    cached = embedding_utils.load_encoder("int8", model_name="tiny", cache_dir=str(tmp_path), warmup=False)
+    assert loads == ["fp32", "skeleton"]
+    assert len(quantize_calls) == 1
+    assert (cached.encode(["a"]) == converted.encode(["a"])).all()